@@ -1,17 +1,38 @@
 import streamlit as st
-import yfinance as yf
 import pandas as pd
-from datetime import datetime, date, timedelta
+import numpy as np
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # 1. Setup & Fixed Metadata
 TICKERS = ["MFA-PC", "RITM-PA", "RITM-PB"]
 ISDA_SPREAD = 0.002616
+QUOTE_TTL = 300  # seconds
+SCHEMA_VERSION = 5
 
 META = {
     "MFA-PC": {"margin": 0.05345, "prev_coupon": 0.6139, "declared": None},
     "RITM-PA": {"margin": 0.05802, "prev_coupon": 0.6565, "declared": 0.09915},
     "RITM-PB": {"margin": 0.05640, "prev_coupon": 0.6461, "declared": 0.09753},
 }
+META_DF = pd.DataFrame.from_dict(META, orient='index')
+# Lookup arrays aligned to TICKERS, indexed by ticker_codes()
+TICKER_DTYPE = pd.CategoricalDtype(TICKERS)
+MARGINS = META_DF.loc[TICKERS, 'margin'].to_numpy(dtype=float)
+DECLARED = META_DF.loc[TICKERS, 'declared'].to_numpy(dtype=float)
+PREV_COUPONS = META_DF.loc[TICKERS, 'prev_coupon'].to_numpy(dtype=float)
+
+def ticker_codes(tickers):
+    if isinstance(tickers.dtype, pd.CategoricalDtype) and tickers.cat.categories.equals(TICKER_DTYPE.categories):
+        codes = tickers.cat.codes.to_numpy()
+    else:
+        # Match by value: a categorical pickled or kept across a reload may order its
+        # categories differently, and unordered dtypes compare equal regardless
+        codes = TICKER_DTYPE.categories.get_indexer(tickers)
+    # -1 marks a ticker outside TICKERS; indexing with it would silently wrap
+    if (codes < 0).any():
+        raise KeyError(f"Unknown ticker(s): {sorted(set(tickers[codes < 0]))}")
+    return codes
 
 st.set_page_config(layout="wide", page_title="Preferred Stock Tracker")
 
@@ -26,66 +47,70 @@ with col_btn:
     refresh = st.button("Refresh", use_container_width=True)
 
 # 3. Data Fetching
-@st.cache_data(ttl=300)
-def fetch_live_data():
-    data = []
-    for ticker in TICKERS:
-        t = yf.Ticker(ticker)
-        hist = t.history(period="1d")
-        price = hist['Close'].iloc[-1] if not hist.empty else 25.00
-        
-        divs = t.dividends
-        if not divs.empty:
-            last_ex = divs.index[-1].to_pydatetime().date()
-            next_ex = (divs.index[-1] + timedelta(days=91)).date()
-        else:
-            last_ex = date(2025, 10, 31)
-            next_ex = date(2026, 1, 30)
-        
-        data.append({
-            "Ticker": ticker,
-            "Margin": f"{META[ticker]['margin']*100:.2f}%",
-            "Last Ex-Date": last_ex,
-            "Market Price": round(float(price), 2),
-            "Accrued Interest": 0.0,
-            "Clean Price": 0.0,
-            "Yield on Clean": "",
-            "Next Ex-Date": next_ex,
-            "Next Payout": "",
-            "Current Coupon": "",
-            "Projected Coupon": "",
-            "Prev Coupon": f"${META[ticker]['prev_coupon']:.2f}"
-        })
-    return pd.DataFrame(data)
+def _fetch_one(ticker, prices):
+    import yfinance as yf
+    closes = prices[ticker]['Close'].dropna() if ticker in prices.columns.get_level_values(0) else pd.Series(dtype=float)
+    price = closes.iloc[-1] if not closes.empty else 25.00
+    
+    # Only the latest ex-date is used, so fetch one year of history instead of period="max"
+    divs = yf.Ticker(ticker).history(period="1y", actions=True).get('Dividends', pd.Series(dtype=float))
+    divs = divs[divs > 0]
+    # Yahoo stamps dividends in exchange time; keep naive dates to match `today`
+    last_ts = divs.index[-1].tz_localize(None) if not divs.empty else pd.Timestamp("2025-10-31")
+    last_ex, next_ex = last_ts.normalize(), (last_ts + pd.Timedelta(days=91)).normalize()
+    
+    return round(float(price), 2), last_ex, next_ex
+
+# Disk-persisted caches ignore ttl, so expiry is folded into the key via
+# time_bucket; bump schema_version whenever the returned columns change.
+@st.cache_data(persist="disk", max_entries=4, show_spinner="Fetching quotes…")
+def fetch_live_data(schema_version, time_bucket):
+    import yfinance as yf  # deferred: cache hits never need it
+    # One batched quote request for every ticker; dividends still need a call each
+    prices = yf.download(TICKERS, period="1d", group_by="ticker", threads=True, progress=False)
+    # Yahoo round-trips are I/O bound; overlap them instead of paying one per ticker
+    with ThreadPoolExecutor(max_workers=len(TICKERS)) as executor:
+        market_prices, last_exs, next_exs = zip(*executor.map(lambda ticker: _fetch_one(ticker, prices), TICKERS))
+    
+    # Typed input columns only; calculate_metrics adds the derived ones
+    return pd.DataFrame({
+        "Ticker": pd.Categorical(TICKERS, dtype=TICKER_DTYPE),
+        "Last Ex-Date": pd.to_datetime(list(last_exs)),
+        "Market Price": np.array(market_prices, dtype=np.float64),
+        "Next Ex-Date": pd.to_datetime(list(next_exs)),
+    })
 
 # 4. Calculation Engine (Actual/360)
-def calculate_metrics(df, sofr):
-    calc_df = df.copy()
-    for i, row in calc_df.iterrows():
-        ticker = row['Ticker']
-        m = META[ticker]
-        price = float(row['Market Price'])
-        
-        current_rate = m['declared'] if m['declared'] else (sofr + m['margin'] + ISDA_SPREAD)
-        projected_rate = sofr + m['margin'] + ISDA_SPREAD
-        
-        last_ex = row['Last Ex-Date']
-        last_ex_dt = datetime.combine(last_ex, datetime.min.time())
-        days_elapsed = (datetime.now() - last_ex_dt).days
-        
-        accrued = (25.0 * current_rate) * (days_elapsed / 360)
-        clean_price = price - accrued
-        annual_payout = 25.0 * current_rate
-        yoc = annual_payout / clean_price if clean_price > 0 else 0
-        
-        calc_df.at[i, 'Current Coupon'] = f"{current_rate*100:.2f}%"
-        calc_df.at[i, 'Projected Coupon'] = f"{projected_rate*100:.2f}%"
-        calc_df.at[i, 'Accrued Interest'] = round(accrued, 2)
-        calc_df.at[i, 'Clean Price'] = round(clean_price, 2)
-        calc_df.at[i, 'Yield on Clean'] = f"{yoc*100:.2f}%"
-        calc_df.at[i, 'Next Payout'] = f"${(annual_payout / 4):.2f}"
-        
-    return calc_df
+def frame_signature(d):
+    return pd.util.hash_pandas_object(d, index=False).values.tobytes()
+
+# Pure in (df, sofr, today), so identical reruns are served from the cache
+@st.cache_data(show_spinner=False, max_entries=32, hash_funcs={pd.DataFrame: frame_signature})
+def calculate_metrics(df, sofr, today):
+    codes = ticker_codes(df['Ticker'])
+    margins, declared = MARGINS[codes], DECLARED[codes]
+    price = df['Market Price'].to_numpy(dtype=float)
+    
+    projected_rate = sofr + margins + ISDA_SPREAD
+    current_rate = np.where(np.isnan(declared), projected_rate, declared)
+    
+    last_ex = pd.to_datetime(df['Last Ex-Date']).to_numpy().astype('datetime64[D]')
+    # Dividing by one day keeps a cleared (NaT) date as NaN instead of int64-min
+    days_elapsed = (today.to_datetime64().astype('datetime64[D]') - last_ex) / np.timedelta64(1, 'D')
+    
+    accrued = (25.0 * current_rate) * (days_elapsed / 360)
+    clean_price = price - accrued
+    annual_payout = 25.0 * current_rate
+    yoc = np.divide(annual_payout, clean_price, out=np.zeros_like(clean_price), where=clean_price > 0)
+    
+    return df.assign(**{
+        'Current Coupon': current_rate * 100,
+        'Projected Coupon': projected_rate * 100,
+        'Accrued Interest': accrued.round(2),
+        'Clean Price': clean_price.round(2),
+        'Yield on Clean': yoc * 100,
+        'Next Payout': annual_payout / 4,
+    })
 
 if refresh:
     st.cache_data.clear()
@@ -93,19 +118,37 @@ if refresh:
     st.rerun()
 
 if 'df' not in st.session_state:
-    st.session_state.df = fetch_live_data()
+    st.session_state.df = fetch_live_data(SCHEMA_VERSION, int(time.time() // QUOTE_TTL))
 
 # 5. Render Main Table
-display_df = calculate_metrics(st.session_state.df, sofr_dec)
+display_df = calculate_metrics(st.session_state.df, sofr_dec, pd.Timestamp.now().normalize())
+# Static display columns are attached here, outside the calc path
+codes = ticker_codes(display_df['Ticker'])
+display_df['Margin'] = MARGINS[codes] * 100
+display_df['Prev Coupon'] = PREV_COUPONS[codes]
 column_order = ["Ticker", "Margin", "Last Ex-Date", "Market Price", "Accrued Interest", "Clean Price", "Yield on Clean", "Next Ex-Date", "Next Payout", "Current Coupon", "Projected Coupon", "Prev Coupon"]
 
+# Everything else is derived from these, so only they can mark the frame dirty
+editable_columns = ["Last Ex-Date", "Market Price", "Next Ex-Date"]
+display_sig = frame_signature(display_df[editable_columns])
+
 edited_df = st.data_editor(
-    display_df[column_order],
+    display_df,
     column_config={
+        "Margin": st.column_config.NumberColumn(format="%.2f%%"),
+        "Last Ex-Date": st.column_config.DateColumn(),
+        "Next Ex-Date": st.column_config.DateColumn(),
         "Market Price": st.column_config.NumberColumn(format="$%.2f"),
         "Accrued Interest": st.column_config.NumberColumn(format="$%.2f"),
         "Clean Price": st.column_config.NumberColumn(format="$%.2f"),
+        "Yield on Clean": st.column_config.NumberColumn(format="%.2f%%"),
+        "Next Payout": st.column_config.NumberColumn(format="$%.2f"),
+        "Current Coupon": st.column_config.NumberColumn(format="%.2f%%"),
+        "Projected Coupon": st.column_config.NumberColumn(format="%.2f%%"),
+        "Prev Coupon": st.column_config.NumberColumn(format="$%.2f"),
     },
+    column_order=column_order,
+    disabled=[c for c in column_order if c not in editable_columns],
     use_container_width=True, hide_index=True, key="main_editor"
 )
 
@@ -116,24 +159,23 @@ st.subheader("📉 Yield Sensitivity: Rate Cut Scenarios")
 shifts = [0.0, -0.0025, -0.0050, -0.0075, -0.0100, -0.0125, -0.0150]
 shift_labels = ["Current SOFR", "SOFR -0.25%", "SOFR -0.50%", "SOFR -0.75%", "SOFR -1.00%", "SOFR -1.25%", "SOFR -1.50%"]
 
-sensitivity_data = []
-for i, row in edited_df.iterrows():
-    ticker = row['Ticker']
-    m = META[ticker]
-    clean_p = float(row['Clean Price'])
-    ticker_yields = {"Ticker": ticker}
+@st.cache_data(show_spinner=False, max_entries=32, hash_funcs={pd.DataFrame: frame_signature})
+def build_sensitivity(df, sofr):
+    margins = MARGINS[ticker_codes(df['Ticker'])]
+    clean_p = df['Clean Price'].to_numpy(dtype=float)
+    
+    # (tickers x shifts) yield matrix in one broadcast
+    scenario_coupons = (sofr + np.array(shifts))[None, :] + (margins + ISDA_SPREAD)[:, None]
+    s_yields = np.divide(25.0 * scenario_coupons, clean_p[:, None], out=np.zeros_like(scenario_coupons), where=clean_p[:, None] > 0)
     
-    for shift, label in zip(shifts, shift_labels):
-        scenario_sofr = sofr_dec + shift
-        scenario_coupon = scenario_sofr + m['margin'] + ISDA_SPREAD
-        s_yield = (25.0 * scenario_coupon) / clean_p if clean_p > 0 else 0
-        ticker_yields[label] = f"{s_yield*100:.2f}%"
-            
-    sensitivity_data.append(ticker_yields)
+    sensitivity_df = pd.DataFrame(np.char.mod("%.2f%%", s_yields * 100), columns=shift_labels)
+    sensitivity_df.insert(0, "Ticker", df['Ticker'].to_numpy())
+    return sensitivity_df
 
-st.dataframe(pd.DataFrame(sensitivity_data), use_container_width=True, hide_index=True)
+sensitivity_df = build_sensitivity(edited_df[["Ticker", "Clean Price"]], sofr_dec)
+st.dataframe(sensitivity_df, use_container_width=True, hide_index=True)
 
 # Sync edits
-if not edited_df.equals(display_df[column_order]):
-    st.session_state.df = edited_df
+if frame_signature(edited_df[editable_columns]) != display_sig:
+    st.session_state.df = edited_df[["Ticker"] + editable_columns]
     st.rerun()